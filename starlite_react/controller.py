@@ -1,14 +1,41 @@
+import gzip
+import hashlib
+import os
+from collections import OrderedDict
+from collections.abc import Hashable, Iterator
 from functools import lru_cache
 from mimetypes import guess_type
+from os.path import splitext
 from pathlib import Path
+from threading import Lock
+from typing import Any, NamedTuple
+from weakref import WeakValueDictionary
 
+from anyio.to_thread import run_sync
 from starlite.connection import Request
 from starlite.controller import Controller
 from starlite.datastructures import Provide
 from starlite.exceptions import HTTPException, NotFoundException
 from starlite.handlers import get
-from starlite.response import Response
-from starlite.types import Dependencies
+from starlite.response import FileResponse, Response
+from starlite.router import Router
+from starlite.status_codes import HTTP_200_OK, HTTP_304_NOT_MODIFIED
+from starlite.types import (
+    Dependencies,
+    HTTPResponseStartEvent,
+    Receive,
+    Scope,
+    Send,
+)
+
+ROOT_PATH_VARIABLE = b"{{ROOT_PATH}}"
+# encoded once and shared by every response, the same way starlite shares raw headers between responses
+VARY_HEADERS = [(b"vary", b"accept-encoding")]
+GZIP_HEADERS = [(b"content-encoding", b"gzip"), *VARY_HEADERS]
+# the contents of a file and its gzip compressed copy
+FileContents = tuple[bytes, bytes | None]
+# the responses for a file and its gzip compressed copy
+FileResponses = tuple["CachedResponse", "CachedResponse | None"]
 
 
 class ReactFileResponse(Response[bytes]):
@@ -20,24 +47,427 @@ def get_root_path(request: Request[None, None]) -> str:
     return request.scope.get("root_path", "/")
 
 
-@lru_cache
-def get_media_type(path: Path) -> str:
+def get_accepts_gzip(request: Request[None, None]) -> bool:
     """
-    auto-detect the correct media type using the name of the file
+    return True if the "accept-encoding" header accepts gzip either by name or through the "*" wildcard
+
+    always False if the app compresses responses itself as a precompressed copy would be compressed twice
     """
 
-    if path.name.endswith(".css.map") or path.name.endswith(".js.map"):
+    if request.app.compression_config is not None:
+        return False
+    accepts_any = False
+    for value in request.headers.get("accept-encoding", "").split(","):
+        encoding, _, params = value.partition(";")
+        encoding = encoding.strip().lower()
+        if encoding in ("gzip", "*"):
+            _, _, quality = params.partition("q=")
+            try:
+                accepted = float(quality or 1) > 0
+            except ValueError:
+                accepted = False
+            # an explicit gzip entry always takes precedence over the wildcard
+            if encoding == "gzip":
+                return accepted
+            accepts_any = accepted
+    return accepts_any
+
+
+MEDIA_TYPES = {
+    ".css": "text/css",
+    ".gif": "image/gif",
+    ".html": "text/html",
+    ".ico": "image/vnd.microsoft.icon",
+    ".jpeg": "image/jpeg",
+    ".jpg": "image/jpeg",
+    ".js": "application/javascript",
+    ".json": "application/json",
+    ".png": "image/png",
+    ".svg": "image/svg+xml",
+    ".txt": "text/plain",
+    ".webp": "image/webp",
+    ".woff": "font/woff",
+    ".woff2": "font/woff2",
+}
+"""
+    The media types of the files found in a React build. Other files fall back to [guess_type][mimetypes.guess_type]
+    which depends on the mime.types files of the platform.
+"""
+
+
+@lru_cache
+def _get_media_type(name: str) -> str:
+    if name.endswith((".css.map", ".js.map")):
         return "application/json"
     else:
-        media_type, _ = guess_type(path.name)
+        media_type = MEDIA_TYPES.get(splitext(name)[1].lower())
+        if media_type is None:
+            media_type, _ = guess_type(name)
         if isinstance(media_type, str):
             return media_type
         else:
             raise HTTPException(
-                detail=f"unknown media type for {path.name}", status_code=400
+                detail=f"unknown media type for {name}", status_code=400
             )
 
 
+def get_media_type(path: Path) -> str:
+    """
+    auto-detect the correct media type using the name of the file
+    """
+
+    return _get_media_type(path.name)
+
+
+@lru_cache
+def get_full_root_path(root_path: str, controller_path: str) -> bytes:
+    """
+    return the encoded value which replaces "{{ROOT_PATH}}"
+    """
+
+    root_path_set: list[str] = []
+    root_path_set.extend(filter(None, root_path.split("/")))
+    root_path_set.extend(filter(None, controller_path.split("/")))
+    full_root_path = "/" + "/".join(root_path_set) if root_path_set else ""
+    return full_root_path.encode("utf-8")
+
+
+def find_root_path_offsets(raw_file_content: bytes) -> tuple[int, ...]:
+    """
+    return the offset of every "{{ROOT_PATH}}" in the file contents
+    """
+
+    offsets: list[int] = []
+    offset = raw_file_content.find(ROOT_PATH_VARIABLE)
+    while offset != -1:
+        offsets.append(offset)
+        offset = raw_file_content.find(
+            ROOT_PATH_VARIABLE, offset + len(ROOT_PATH_VARIABLE)
+        )
+    return tuple(offsets)
+
+
+def get_file_contents(
+    raw_file_content: bytes,
+    root_path_offsets: tuple[int, ...],
+    full_root_path: bytes | None,
+    compress: bool,
+) -> FileContents:
+    """
+    replace "{{ROOT_PATH}}" in the file contents and gzip compress the result
+
+    `full_root_path` is spliced in at the offsets which [find_root_path_offsets][starlite_react.controller.find_root_path_offsets]
+    found in these exact contents so they are never scanned again
+    the compressed copy is None if `compress` is False or compression does not make the file smaller
+    """
+
+    parts: list[bytes] = []
+    start = 0
+    for offset in root_path_offsets:
+        parts.append(raw_file_content[start:offset])
+        start = offset + len(ROOT_PATH_VARIABLE)
+    parts.append(raw_file_content[start:])
+    file_content = (full_root_path or b"").join(parts)
+    if not compress:
+        return file_content, None
+    gzip_content = gzip.compress(file_content, compresslevel=9, mtime=0)
+    if len(gzip_content) >= len(file_content):
+        return file_content, None
+    return file_content, gzip_content
+
+
+def get_etag(content: bytes) -> bytes:
+    """
+    return a weak etag for the given file contents
+
+    the etag is weak so the gzip compressed copy of the file can share it
+    """
+
+    return b'W/"' + hashlib.blake2b(content, digest_size=16).hexdigest().encode() + b'"'
+
+
+def is_not_modified(scope: Scope, etag: bytes) -> bool:
+    """
+    return True if the "if-none-match" header of the request matches the given etag
+    """
+
+    for name, value in scope["headers"]:
+        if name == b"if-none-match":
+            tags = (tag.strip().removeprefix(b"W/") for tag in value.split(b","))
+            return any(tag in (etag.removeprefix(b"W/"), b"*") for tag in tags)
+    return False
+
+
+class CachedResponse:
+    """
+    The contents of a file and its headers which are encoded once and then shared by every request
+    """
+
+    __slots__ = (
+        "body",
+        "content_length",
+        "etag",
+        "headers",
+        "media_type",
+        "not_modified_headers",
+    )
+
+    def __init__(
+        self,
+        content: bytes,
+        media_type: str,
+        raw_headers: list[tuple[bytes, bytes]],
+        etag: bytes,
+    ) -> None:
+        response = ReactFileResponse(content=content, media_type=media_type)
+        response.raw_headers = [(b"etag", etag), *raw_headers]
+        self.body = content
+        self.content_length = (b"content-length", str(len(content)).encode("latin-1"))
+        self.etag = etag
+        self.headers = response.encode_headers()
+        self.media_type = media_type
+        # a 304 response only repeats the headers which describe the cached representation
+        self.not_modified_headers = [
+            (name, value)
+            for name, value in response.raw_headers
+            if name in (b"etag", b"vary")
+        ]
+
+
+class CachedFileResponse(ReactFileResponse):
+    """
+    A response for a [CachedResponse][starlite_react.controller.CachedResponse]. A new one is created for every
+    request so whatever receives it (such as a hook) can modify it without changing the cached response.
+    """
+
+    def __init__(self, cached: CachedResponse) -> None:
+        # the headers which the base class would encode for every request are already encoded by the cached response
+        self.background = None
+        self.body = cached.body
+        self.cached = cached
+        self.cookies = []
+        self.encoding = "utf-8"
+        self.headers = {}
+        self.is_head_response = False
+        self.media_type = cached.media_type
+        self.raw_headers = []
+        self.status_allows_body = True
+        self.status_code = HTTP_200_OK
+
+    def encode_headers(self) -> list[tuple[bytes, bytes]]:
+        headers = list(
+            self.cached.not_modified_headers
+            if self.status_code == HTTP_304_NOT_MODIFIED
+            else self.cached.headers
+        )
+        # only the headers which were added to this response are encoded here
+        if self.headers or self.cookies or self.raw_headers:
+            replaced = {name.lower().encode("latin-1") for name in self.headers}
+            headers = [header for header in headers if header[0] not in replaced]
+            headers.extend(super().encode_headers())
+        return headers
+
+    async def start_response(self, send: Send) -> None:
+        headers = self.encode_headers()
+        if self.status_allows_body:
+            headers.append(
+                self.cached.content_length
+                if self.body is self.cached.body
+                else (b"content-length", str(len(self.body)).encode("latin-1"))
+            )
+        event: HTTPResponseStartEvent = {
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": headers,
+        }
+        await send(event)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if is_not_modified(scope, self.cached.etag):
+            # the client already has this file so only repeat the headers which describe it
+            self.status_code = HTTP_304_NOT_MODIFIED
+            self.status_allows_body = False
+            self.body = b""
+        await super().__call__(scope, receive, send)
+
+
+def get_file_responses(
+    raw_file_content: bytes,
+    root_path_offsets: tuple[int, ...],
+    media_type: str,
+    full_root_path: bytes | None,
+    compress: bool,
+) -> FileResponses:
+    """
+    build the responses for the output of [get_file_contents][starlite_react.controller.get_file_contents]
+    """
+
+    file_content, gzip_content = get_file_contents(
+        raw_file_content, root_path_offsets, full_root_path, compress
+    )
+    etag = get_etag(file_content)
+    response = CachedResponse(
+        file_content, media_type, VARY_HEADERS if compress else [], etag
+    )
+    if gzip_content is None:
+        return response, None
+    return response, CachedResponse(gzip_content, media_type, GZIP_HEADERS, etag)
+
+
+class FileResponsesCache:
+    """
+    A least recently used cache for the output of [get_file_responses][starlite_react.controller.get_file_responses]
+    which is bounded by the number of bytes held instead of the number of entries
+    """
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self.size = 0
+        self._lock = Lock()
+        self._responses: OrderedDict[Hashable, FileResponses] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._responses)
+
+    @staticmethod
+    def get_size(responses: FileResponses) -> int:
+        response, gzip_response = responses
+        return len(response.body) + (len(gzip_response.body) if gzip_response else 0)
+
+    def get(self, key: Hashable) -> FileResponses | None:
+        with self._lock:
+            responses = self._responses.get(key)
+            if responses is not None:
+                self._responses.move_to_end(key)
+            return responses
+
+    def set(self, key: Hashable, responses: FileResponses) -> None:
+        size = self.get_size(responses)
+        # a file larger than the cache would only evict everything else
+        if size > self.max_size:
+            return
+        with self._lock:
+            previous = self._responses.pop(key, None)
+            if previous is not None:
+                self.size -= self.get_size(previous)
+            self._responses[key] = responses
+            self.size += size
+            while self.size > self.max_size:
+                _, evicted = self._responses.popitem(last=False)
+                self.size -= self.get_size(evicted)
+
+
+file_responses = FileResponsesCache(max_size=64 * 1024 * 1024)
+"""
+    The responses built by every [ReactController][starlite_react.ReactController] in the process. Files which may
+    contain "{{ROOT_PATH}}" are keyed by the digest of their raw contents, the media type, the "{{ROOT_PATH}}" value
+    and whether gzip is enabled while other files are keyed by their path, modification time, size and media type.
+    Controllers which serve the same build therefore share a single copy of each response while a rebuilt file
+    never matches the responses of its previous contents.
+"""
+
+
+def read_file(path: str) -> bytes:
+    """
+    return the raw contents of the given file
+    """
+
+    with open(path, "rb") as fh:
+        return fh.read()
+
+
+class RawFile:
+    """
+    The raw contents of a file which may contain "{{ROOT_PATH}}"
+    """
+
+    __slots__ = ("content", "digest", "root_path_offsets", "__weakref__")
+
+    def __init__(self, content: bytes, digest: bytes) -> None:
+        self.content = content
+        self.digest = digest
+        # found in `content` itself so the offsets always describe the same contents
+        self.root_path_offsets = find_root_path_offsets(content)
+
+
+raw_files: WeakValueDictionary[bytes, RawFile] = WeakValueDictionary()
+"""
+    The raw files indexed by every [ReactController][starlite_react.ReactController] in the process keyed by the
+    digest of their contents. Controllers which serve the same build therefore share a single copy of each file and
+    an entry is released once no controller holds it.
+"""
+
+
+def get_raw_file(path: str) -> RawFile:
+    """
+    return the raw contents of the given file
+
+    the contents are shared with every controller which indexed a file with the same contents
+    """
+
+    content = read_file(path)
+    digest = hashlib.blake2b(content, digest_size=16).digest()
+    raw_file = raw_files.get(digest)
+    if raw_file is None:
+        raw_file = raw_files[digest] = RawFile(content, digest)
+    return raw_file
+
+
+class ReactFile(NamedTuple):
+    path: Path
+    """
+        The resolved [Path][pathlib.Path] of the file.
+    """
+    media_type: str
+    """
+        The media type of the file.
+    """
+    raw: RawFile | None
+    """
+        The raw contents of files which may contain "{{ROOT_PATH}}". Other files are read from disk when their
+        responses are built.
+    """
+    stat_result: os.stat_result
+    """
+        The result of calling stat() on the file when it was indexed.
+    """
+
+
+def get_react_file_responses(
+    file: ReactFile, full_root_path: bytes | None, compress: bool
+) -> FileResponses:
+    """
+    build the responses for the given file and read it from disk if its contents are not held in memory
+    """
+
+    if file.raw is None:
+        return get_file_responses(
+            read_file(str(file.path)), (), file.media_type, None, False
+        )
+    return get_file_responses(
+        file.raw.content,
+        file.raw.root_path_offsets,
+        file.media_type,
+        full_root_path,
+        compress,
+    )
+
+
+def scan_directory(directory: str) -> Iterator[os.DirEntry[str]]:
+    """
+    recursively yield the files in the given directory without following linked directories
+
+    unlike [Path.is_file][pathlib.Path.is_file], [DirEntry.is_file][os.DirEntry.is_file] only calls stat() for links
+    """
+
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                yield from scan_directory(entry.path)
+            elif entry.is_file():
+                yield entry
+
+
 class ReactController(Controller):
     directory: Path
     """
@@ -51,54 +481,118 @@ class ReactController(Controller):
     """
         A set of strings which may contain the "{{ROOT_FILE}}" variable.
     """
-    dependencies: Dependencies = {"root_path": Provide(get_root_path)}
+    gzip_files: bool = True
+    """
+        Serve gzip compressed copies of the in-memory files to clients which accept them.
+        This is ignored if the app is configured to compress responses itself.
+    """
+    dependencies: Dependencies = {
+        "root_path": Provide(get_root_path),
+        "accepts_gzip": Provide(get_accepts_gzip),
+    }
+    """
+        Add the "root_path" and "accepts_gzip" dependencies
+    """
+
+    files: dict[str, ReactFile]
     """
-        Add the "root_path" dependency
+        The files found in `directory` keyed by their path relative to it.
     """
 
-    @lru_cache
-    def get_file_contents(self, path: Path, root_path: str) -> bytes:
+    def __init__(self, owner: Router) -> None:
+        super().__init__(owner)
+        # the app compresses every response itself so precompressed copies would never be served
+        if getattr(owner, "compression_config", None) is not None:
+            self.gzip_files = False
+        # the build directory does not change at runtime so index and read it once
+        self.files = {}
+        directory = os.path.realpath(self.directory)
+        for entry in scan_directory(directory):
+            filename = entry.path[len(directory) + 1 :]
+            # never serve a file which is linked from outside of the directory
+            if entry.is_symlink():
+                filepath = os.path.realpath(entry.path)
+                if not filepath.startswith(directory + os.sep):
+                    continue
+            else:
+                filepath = entry.path
+            try:
+                media_type = _get_media_type(entry.name)
+            except HTTPException:
+                continue
+            self.files[filename.replace(os.sep, "/")] = ReactFile(
+                path=Path(filepath),
+                media_type=media_type,
+                raw=(
+                    get_raw_file(filepath)
+                    if splitext(entry.name)[1] in self.root_file_suffixes
+                    else None
+                ),
+                stat_result=entry.stat(),
+            )
+
+    async def get_file_response(
+        self, path: str, root_path: str, accepts_gzip: bool = False
+    ) -> Response[Any]:
         """
-        return the contents of the given file
+        return the response for the given file
+
+        responses are built once for each root path (or only once if the file does not reference the root path)
+        and only files which are too large to be cached are streamed from disk
         """
 
-        # get the contents of the file
-        with open(path, "rb") as fh:
-            file_content = fh.read()
-
-        # detect {{ROOT_PATH}} in the static files and replace it with app.root_path
-        if path.suffix in self.root_file_suffixes:
-            root_path_set: list[str] = []
-            root_path_set.extend(filter(None, root_path.split("/")))
-            root_path_set.extend(filter(None, self.path.split("/")))
-            full_root_path = "/" + "/".join(root_path_set) if root_path_set else ""
-            file_content = file_content.replace(
-                b"{{ROOT_PATH}}", full_root_path.encode("utf-8")
+        if path not in self.files:
+            raise NotFoundException()
+        file = self.files[path]
+        key: Hashable
+        if file.raw is None:
+            if file.stat_result.st_size > file_responses.max_size:
+                return FileResponse(
+                    file.path,
+                    content_disposition_type="inline",
+                    media_type=file.media_type,
+                    stat_result=file.stat_result,
+                )
+            full_root_path = None
+            key = (
+                str(file.path),
+                file.stat_result.st_mtime_ns,
+                file.stat_result.st_size,
+                file.media_type,
             )
-
-        return file_content
+        else:
+            full_root_path = (
+                get_full_root_path(root_path, self.path)
+                if file.raw.root_path_offsets
+                else None
+            )
+            key = (file.raw.digest, file.media_type, full_root_path, self.gzip_files)
+        responses = file_responses.get(key)
+        if responses is None:
+            # reading, replacing and compressing block so only do it once and off of the event loop
+            try:
+                responses = await run_sync(
+                    get_react_file_responses, file, full_root_path, self.gzip_files
+                )
+            except FileNotFoundError:
+                raise NotFoundException()
+            file_responses.set(key, responses)
+        response, gzip_response = responses
+        if accepts_gzip and gzip_response is not None:
+            return CachedFileResponse(gzip_response)
+        return CachedFileResponse(response)
 
     @get("/static/{path:path}", name="react-static", include_in_schema=False)
-    async def static_files(self, root_path: str, path: Path) -> ReactFileResponse:
-        filepath = self.directory / "static" / str(path)[1:]
-        if not filepath.is_file():
-            raise NotFoundException()
-        # detect media type
-        media_type = get_media_type(filepath)
-        # get the contents of the file
-        file_content = self.get_file_contents(filepath, root_path)
-        return ReactFileResponse(content=file_content, media_type=media_type)
+    async def static_files(
+        self, root_path: str, accepts_gzip: bool, path: str
+    ) -> Response[Any]:
+        return await self.get_file_response(f"static{path}", root_path, accepts_gzip)
 
     @get(path=["/", "/{filename:str}"], name="react-root", include_in_schema=False)
     async def root_files(
-        self, root_path: str, filename: Path | None = None
-    ) -> ReactFileResponse:
-        filepath = self.directory / filename if filename else self.directory
+        self, root_path: str, accepts_gzip: bool, filename: str | None = None
+    ) -> Response[Any]:
         # if the request file does not exist, return the default file
-        if not filepath.is_file():
-            filepath = self.directory / self.default_index
-        # detect media type
-        media_type = get_media_type(filepath)
-        # get the contents of the file
-        file_content = self.get_file_contents(filepath, root_path)
-        return ReactFileResponse(content=file_content, media_type=media_type)
+        if filename is None or filename not in self.files:
+            filename = self.default_index
+        return await self.get_file_response(filename, root_path, accepts_gzip)
@@ -1,15 +1,31 @@
+import asyncio
+import gzip
+import httpx
+import os
 import pytest
 from pathlib import Path
+from typing import Any
+from urllib.parse import unquote
 
+from starlite.app import Starlite
+from starlite.config import CompressionConfig
 from starlite.controller import Controller
 from starlite.enums import MediaType
 from starlite.exceptions import NotFoundException
 from starlite.handlers import get
+from starlite.response import Response
+from starlite.router import Router
+from starlite.types import ASGIApp
 from starlite.testing import create_test_client
 
 
 from starlite_react import ReactController
-
+from starlite_react.controller import (
+    CachedResponse,
+    FileResponsesCache,
+    find_root_path_offsets,
+    get_file_contents,
+)
 
 react_build_directory = Path(__file__).parent / "react-build"
 
@@ -28,21 +44,65 @@ react_file_suffixes = {
 
 
 @pytest.fixture(scope="session")
-def react_files() -> list[tuple[Path, bytes]]:
-    filterd_files = filter(lambda x: x.is_file(), react_build_directory.rglob("**/*"))
-    files = [
-        (
-            x.relative_to(react_build_directory),
-            x.read_bytes(),
-        )
-        for x in filterd_files
-    ]
+def react_files() -> list[tuple[Path, bytes, str]]:
+    files: list[tuple[Path, bytes, str]] = []
+    # os.walk lists the directories with os.scandir so the files do not need to be stat()'d again
+    prefix_length = len(str(react_build_directory)) + 1
+    for directory, _, filenames in os.walk(react_build_directory):
+        for filename in filenames:
+            filepath = os.path.join(directory, filename)
+            path = Path(filepath[prefix_length:])
+            with open(filepath, "rb") as fh:
+                files.append((path, fh.read(), react_file_suffixes[path.suffix]))
     assert len(files) > 0
-    assert len([path for path, content in files if b"{{ROOT_PATH}}" in content]) > 0
+    assert any(b"{{ROOT_PATH}}" in content for _, content, _ in files)
 
     return files
 
 
+@pytest.fixture
+def anyio_backend() -> str:
+    return "asyncio"
+
+
+@pytest.fixture(scope="module", params=["", "/react"])
+def react_app(request: pytest.FixtureRequest) -> tuple[Starlite, str]:
+    """
+    build the app once per controller path as indexing the react build is the expensive part of startup
+
+    root_path is set per request by the transport so the same app is shared by every root_path
+    """
+
+    class TestReactController(ReactController):
+        path = request.param
+        directory = react_build_directory
+
+    return Starlite(route_handlers=[TestReactController]), request.param
+
+
+async def get_react_files(
+    app: Starlite,
+    react_files: list[tuple[Path, bytes, str]],
+    path: str = "",
+    root_path: str = "",
+) -> list[tuple[Path, bytes, str, httpx.Response]]:
+    """
+    request every react file concurrently and return them alongside their responses
+    """
+
+    transport = httpx.ASGITransport(app=app, root_path=root_path)  # type: ignore[arg-type]
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://testserver"
+    ) as client:
+        responses = await asyncio.gather(
+            *(client.get(f"{path}/{file_path}") for file_path, _, _ in react_files)
+        )
+    return [
+        (file_path, content, content_type, response)
+        for (file_path, content, content_type), response in zip(react_files, responses)
+    ]
+
+
 def test_with_additional_routes() -> None:
     class TestReactController(ReactController):
         directory = react_build_directory
@@ -72,125 +132,346 @@ def test_with_additional_routes() -> None:
         assert response.status_code == 200, f"payload: {response.text}"
         assert response.headers.get("content-type") == "text/html; charset=utf-8"
 
+        assert test_client.app.route_reverse("react-root") == "/"
+        assert (
+            test_client.app.route_reverse("react-root", filename="index.html")
+            == "/index.html"
+        )
+
         response = test_client.get(f"/some/arbitrary/path")
         assert response.status_code == 200, f"payload: {response.text}"
         assert response.headers.get("content-type") == "text/html; charset=utf-8"
 
 
-def test_all_react_files(react_files: list[tuple[Path, bytes]]) -> None:
+def test_after_request_hook() -> None:
     class TestReactController(ReactController):
         directory = react_build_directory
 
-    with create_test_client(route_handlers=[TestReactController]) as test_client:
-        for path, content in react_files:
-            expected_content_type = react_file_suffixes[path.suffix]
-            response = test_client.get(f"/{path}")
+    responses: list[Response[Any]] = []
+
+    async def after_request(response: Response[Any]) -> Response[Any]:
+        # only modify the response of the first request
+        if not responses:
+            response.headers["x-hook"] = "1"
+            response.body = b"hook"
+        responses.append(response)
+        return response
+
+    with open(react_build_directory / "index.html", "rb") as fh:
+        expected_content = fh.read().replace(b"{{ROOT_PATH}}", b"")
+
+    with create_test_client(
+        route_handlers=[TestReactController], after_request=after_request
+    ) as test_client:
+        for _ in range(2):
+            response = test_client.get("/")
             assert response.status_code == 200, f"payload: {response.text}"
 
-            # confirm the correct content-type is set
-            assert (
-                response.headers.get("content-type") == expected_content_type
-            ), f"file: {path}"
+        # the second request is served the cached file regardless of what the hook did to the first
+        assert response.content == expected_content
+        assert "x-hook" not in response.headers
 
-            # confirm ROOT_PATH is being replaced
-            if b"{{ROOT_PATH}}" in content:
-                assert "{{ROOT_PATH}}" not in response.text
 
+@pytest.mark.anyio
+async def test_cached_file_response() -> None:
+    class TestReactController(ReactController):
+        directory = react_build_directory
 
-def test_controller_path(react_files: list[tuple[Path, bytes]]) -> None:
+    with open(react_build_directory / "index.html", "rb") as fh:
+        expected_content = fh.read().replace(b"{{ROOT_PATH}}", b"")
+
+    controller = TestReactController(Starlite(route_handlers=[]))
+    for accepts_gzip in [False, True]:
+        # modify the response of one request the way an after_request hook could
+        response = await controller.get_file_response("index.html", "", accepts_gzip)
+        response.headers["x-hook"] = "1"
+        response.set_cookie("hook", "1")
+        response.raw_headers.append((b"x-raw-hook", b"1"))
+        response.body = b"hook"
+        _, headers, body = await get_raw_path(response, "/")
+        assert (b"x-hook", b"1") in headers
+        assert (b"x-raw-hook", b"1") in headers
+        assert (b"content-length", b"4") in headers
+        assert body == b"hook"
+
+        # the next request gets the cached response untouched
+        response = await controller.get_file_response("index.html", "", accepts_gzip)
+        status, headers, body = await get_raw_path(response, "/")
+        assert status == 200
+        names = {name for name, _ in headers}
+        assert not names & {b"x-hook", b"x-raw-hook", b"set-cookie"}
+        assert (b"content-length", str(len(body)).encode()) in headers
+        if accepts_gzip:
+            assert (b"content-encoding", b"gzip") in headers
+            body = gzip.decompress(body)
+        assert body == expected_content
+
+
+def test_gzip_files(react_files: list[tuple[Path, bytes, str]]) -> None:
     class TestReactController(ReactController):
-        path = "/react"
         directory = react_build_directory
 
     with create_test_client(route_handlers=[TestReactController]) as test_client:
-        for path, content in react_files:
-            expected_content_type = react_file_suffixes[path.suffix]
-            response = test_client.get(f"/react/{path}")
+        for path, content, _ in react_files:
+            # without a root path "{{ROOT_PATH}}" is replaced with an empty string
+            expected_content = content.replace(b"{{ROOT_PATH}}", b"")
+
+            response = test_client.get(f"/{path}", headers={"accept-encoding": "gzip"})
             assert response.status_code == 200, f"payload: {response.text}"
 
-            # confirm the correct content-type is set
-            assert (
-                response.headers.get("content-type") == expected_content_type
-            ), f"file: {path}"
+            # only files which are held in memory are compressed
+            if path.suffix in TestReactController.root_file_suffixes:
+                assert response.headers.get("vary") == "accept-encoding"
+            if response.headers.get("content-encoding") == "gzip":
+                assert path.suffix in TestReactController.root_file_suffixes
+                assert int(response.headers["content-length"]) < len(content)
+            # the client decodes the body so it must match the file either way
+            assert response.content == expected_content, f"file: {path}"
+
+            # clients which do not accept gzip get the file as-is
+            response = test_client.get(
+                f"/{path}", headers={"accept-encoding": "identity"}
+            )
+            assert response.status_code == 200, f"payload: {response.text}"
+            assert "content-encoding" not in response.headers, f"file: {path}"
+            assert response.content == expected_content, f"file: {path}"
 
-            # confirm ROOT_PATH is being replaced
-            if b"{{ROOT_PATH}}" in content:
-                assert "{{ROOT_PATH}}" not in response.text
+        # compressible files which are held in memory are always served compressed
+        main_js = next(
+            path for path, _, _ in react_files if path.match("static/js/main.*.js")
+        )
+        for path in [Path("index.html"), main_js]:
+            response = test_client.get(f"/{path}", headers={"accept-encoding": "gzip"})
+            assert response.headers.get("content-encoding") == "gzip", f"file: {path}"
+
+        # the "*" wildcard accepts gzip unless gzip itself is refused
+        for accept_encoding, expected_encoding in [
+            ("*", "gzip"),
+            ("br;q=1, *;q=0.5", "gzip"),
+            ("*;q=0", None),
+            ("gzip;q=0, *", None),
+        ]:
+            response = test_client.get(
+                "/index.html", headers={"accept-encoding": accept_encoding}
+            )
+            assert (
+                response.headers.get("content-encoding") == expected_encoding
+            ), f"accept-encoding: {accept_encoding}"
 
 
-def test_root_path(react_files: list[tuple[Path, bytes]]) -> None:
+def test_compression_middleware(react_files: list[tuple[Path, bytes, str]]) -> None:
     class TestReactController(ReactController):
         directory = react_build_directory
 
-    with create_test_client(
-        route_handlers=[TestReactController], root_path="/testpath"
-    ) as test_client:
-        for path, content in react_files:
-            expected_content_type = react_file_suffixes[path.suffix]
-            response = test_client.get(f"/{path}")
-            assert response.status_code == 200, f"payload: {response.text}"
+    compression_config = CompressionConfig(backend="gzip")
+    route_handlers: list[type[Controller] | Router] = [
+        TestReactController,
+        # a controller on a nested router does not see the config of the app when it is registered
+        Router(path="/", route_handlers=[TestReactController]),
+    ]
+    for route_handler in route_handlers:
+        with create_test_client(
+            route_handlers=route_handler, compression_config=compression_config
+        ) as test_client:
+            for path, content, _ in react_files:
+                response = test_client.get(
+                    f"/{path}", headers={"accept-encoding": "gzip"}
+                )
+                assert response.status_code == 200, f"payload: {response.text}"
+                # the body is only compressed once so it is decoded back to the file
+                assert response.content == content.replace(
+                    b"{{ROOT_PATH}}", b""
+                ), f"file: {path}"
+
+
+async def get_raw_path(
+    app: ASGIApp, raw_path: str
+) -> tuple[int, list[tuple[bytes, bytes]], bytes]:
+    """
+    send a GET request for the path exactly as given since httpx removes ".." segments before sending
+    """
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": unquote(raw_path),
+        "raw_path": raw_path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"host", b"testserver")],
+        "client": ("127.0.0.1", 123),
+        "server": ("testserver", 80),
+    }
+    messages: list[dict[str, Any]] = []
+
+    async def receive() -> dict[str, Any]:
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message: dict[str, Any]) -> None:
+        messages.append(message)
+
+    await app(scope, receive, send)  # type: ignore[arg-type]
+    start = next(m for m in messages if m["type"] == "http.response.start")
+    body = b"".join(
+        m.get("body", b"") for m in messages if m["type"] == "http.response.body"
+    )
+    return start["status"], start["headers"], body
+
+
+@pytest.mark.anyio
+async def test_path_traversal(tmp_path: Path) -> None:
+    build_directory = tmp_path / "build"
+    (build_directory / "static").mkdir(parents=True)
+    (build_directory / "index.html").write_text("index")
+    (tmp_path / "secret.txt").write_text("secret")
+    (build_directory / "secret.txt").symlink_to(tmp_path / "secret.txt")
 
-            # confirm the correct content-type is set
-            assert (
-                response.headers.get("content-type") == expected_content_type
-            ), f"file: {path}"
+    class TestReactController(ReactController):
+        directory = build_directory
+
+    app = Starlite(route_handlers=[TestReactController])
+    for raw_path in [
+        "/secret.txt",
+        "/static/../secret.txt",
+        "/static/../../secret.txt",
+        "/static/%2e%2e/%2e%2e/secret.txt",
+        "/..%2fsecret.txt",
+    ]:
+        _, _, body = await get_raw_path(app, raw_path)
+        assert b"secret" not in body, f"path: {raw_path}"
 
-            # confirm ROOT_PATH is being replaced
-            if b"{{ROOT_PATH}}" in content:
-                assert "/testpath" in response.text
 
+def test_rewritten_files(tmp_path: Path) -> None:
+    (tmp_path / "index.html").write_bytes(b"<p>{{ROOT_PATH}}/index</p>")
+    (tmp_path / "main.js").write_bytes(b'a="{{ROOT_PATH}}/a"')
 
-def test_controller_and_root_path(react_files: list[tuple[Path, bytes]]) -> None:
     class TestReactController(ReactController):
         path = "/react"
+        directory = tmp_path
+
+    with create_test_client(route_handlers=[TestReactController]) as test_client:
+        # a redeploy truncates or rewrites the files in place after they were indexed
+        with open(tmp_path / "index.html", "wb"):
+            pass
+        with open(tmp_path / "main.js", "r+b") as fh:
+            fh.write(b'"{{ROOT_PATH}}"//')
+
+        response = test_client.get("/react/")
+        assert response.status_code == 200, f"payload: {response.text}"
+        assert response.content == b"<p>/react/index</p>"
+
+        # "{{ROOT_PATH}}" is spliced into the contents it was found in
+        response = test_client.get("/react/main.js")
+        assert response.status_code == 200, f"payload: {response.text}"
+        assert response.content == b'a="/react/a"'
+
+    # an app created after a rebuild serves the new contents
+    (tmp_path / "index.html").write_bytes(b"<p>rebuilt {{ROOT_PATH}}/index</p>")
+    with create_test_client(route_handlers=[TestReactController]) as test_client:
+        response = test_client.get("/react/")
+        assert response.status_code == 200, f"payload: {response.text}"
+        assert response.content == b"<p>rebuilt /react/index</p>"
+
+
+def test_shared_raw_files() -> None:
+    class FirstReactController(ReactController):
         directory = react_build_directory
 
-    with create_test_client(
-        route_handlers=[TestReactController], root_path="/testpath"
-    ) as test_client:
-        for path, content in react_files:
-            expected_content_type = react_file_suffixes[path.suffix]
-            response = test_client.get(f"/react/{path}")
-            assert response.status_code == 200, f"payload: {response.text}"
+    class SecondReactController(ReactController):
+        path = "/react"
+        directory = react_build_directory
 
-            # confirm the correct content-type is set
-            assert (
-                response.headers.get("content-type") == expected_content_type
-            ), f"file: {path}"
-
-            # confirm ROOT_PATH is being replaced
-            if b"{{ROOT_PATH}}" in content:
-                assert "/testpath/react" in response.text
-
-    #     for path, content in react_files:
-    #         request_path = f"{controller_path}/{path}"
-    #         expected_content_type = react_file_suffixes[path.suffix]
-    #         response = test_client.get(request_path)
-    #         assert response.status_code == 200, f"payload: {response.text}"
-
-    #         # confirm the correct content-type is set
-    #         assert (
-    #             response.headers.get("content-type") == expected_content_type
-    #         ), f"file: {path}"
-
-    #         # confirm ROOT_PATH is being replaced
-    #         if b"{{ROOT_PATH}}" in content:
-    #             assert "{{ROOT_PATH}}" not in response.text
-    #             assert root_path in response.text, f"file: {path}"
-
-    #         response = test_client.get(f"/api")
-    #         assert response.status_code == 200, f"payload: {response.text}"
-    #         assert response.text == "Hello, World!"
-
-    #     # validate arbirary paths work as well
-    #     # this is required for React Router DOM to function
-    #     for index_path in [
-    #         controller_path,
-    #         f"{controller_path}/testpath1",
-    #         f"{controller_path}/testpath2",
-    #         f"{controller_path}/path1/path2/path3",
-    #     ]:
-    #         response = test_client.get(index_path)
-    #         assert response.status_code == 200, f"payload: {response.text}"
-    #         assert response.headers.get("content-type") == "text/html; charset=utf-8"
-    #         assert "You need to enable JavaScript to run this app." in response.text
+    app = Starlite(route_handlers=[])
+    first, second = FirstReactController(app), SecondReactController(app)
+    assert first.files.keys() == second.files.keys()
+    assert any(file.raw is not None for file in first.files.values())
+    for path, file in first.files.items():
+        # controllers which serve the same build share a single copy of each file
+        assert file.raw is second.files[path].raw, f"file: {path}"
+
+
+def test_root_path_offsets() -> None:
+    content = b"{{ROOT_PATH}}/a {{ROOT_PATH}}{{ROOT_PATH}}/b"
+    offsets = find_root_path_offsets(content)
+    assert offsets == (0, 16, 29)
+    assert get_file_contents(content, offsets, b"/x", False) == (b"/x/a /x/x/b", None)
+    assert get_file_contents(content, (), None, False) == (content, None)
+
+
+def test_file_responses_cache() -> None:
+    def responses(size: int) -> tuple[CachedResponse, None]:
+        return CachedResponse(b"x" * size, "text/plain", [], b'"x"'), None
+
+    cache = FileResponsesCache(max_size=10)
+    cache.set(("a", ""), responses(4))
+    cache.set(("b", ""), responses(4))
+    assert cache.size == 8
+
+    # reading "a" makes "b" the least recently used entry
+    assert cache.get(("a", "")) is not None
+    cache.set(("c", ""), responses(3))
+    assert cache.get(("b", "")) is None
+    assert cache.size == 7
+    assert len(cache) == 2
+
+    # entries larger than the cache are never stored
+    cache.set(("d", ""), responses(11))
+    assert cache.get(("d", "")) is None
+    assert len(cache) == 2
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("root_path", ["", "/testpath"])
+async def test_react_files(
+    react_app: tuple[Starlite, str],
+    react_files: list[tuple[Path, bytes, str]],
+    root_path: str,
+) -> None:
+    app, controller_path = react_app
+    expected_root_path = f"{root_path}{controller_path}".encode()
+    for path, content, expected_content_type, response in await get_react_files(
+        app, react_files, path=controller_path, root_path=root_path
+    ):
+        assert response.status_code == 200, f"payload: {response.text}"
+
+        # confirm the correct content-type is set
+        assert (
+            response.headers.get("content-type") == expected_content_type
+        ), f"file: {path}"
+
+        # every file is served from the cached responses rather than as an attachment
+        assert "etag" in response.headers, f"file: {path}"
+        assert "content-disposition" not in response.headers, f"file: {path}"
+
+        # confirm ROOT_PATH is being replaced
+        if b"{{ROOT_PATH}}" in content:
+            assert b"{{ROOT_PATH}}" not in response.content
+            if expected_root_path:
+                assert expected_root_path in response.content, f"file: {path}"
+        else:
+            assert response.content == content, f"file: {path}"
+
+    # arbitrary paths fall back to the index so react router can handle them
+    transport = httpx.ASGITransport(app=app, root_path=root_path)  # type: ignore[arg-type]
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://testserver"
+    ) as client:
+        response = await client.get(f"{controller_path}/")
+        assert response.status_code == 200, f"payload: {response.text}"
+        assert response.headers.get("content-type") == "text/html; charset=utf-8"
+        assert b"You need to enable JavaScript to run this app." in response.content
+
+        # every fallback path serves the same index so the etag of the first one is still valid
+        etag = response.headers["etag"]
+        for index_path in [
+            f"{controller_path}/testpath1",
+            f"{controller_path}/testpath2",
+            f"{controller_path}/path1/path2/path3",
+        ]:
+            response = await client.get(index_path, headers={"if-none-match": etag})
+            assert response.status_code == 304, f"path: {index_path}"
+            assert response.headers.get("etag") == etag
+            assert response.content == b""